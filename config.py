@@ -1,55 +1,93 @@
 import logging
 import os
-from typing import Optional, Dict, Any
-from pydantic import BaseModel
-from dotenv import load_dotenv
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Final, Mapping
+from pydantic import BaseModel, ConfigDict
+from dotenv import find_dotenv, load_dotenv
 
-# Загрузка переменных из .env файла
-load_dotenv()
+
+@lru_cache(maxsize=1)
+def _env() -> Dict[str, Optional[str]]:
+    """Переменные окружения с учетом .env файла (файл читается один раз)"""
+    # Значения из .env экспортируются в окружение процесса (без перезаписи существующих),
+    # чтобы их видели и библиотеки, читающие os.environ напрямую (например, прокси для DDGS)
+    load_dotenv(find_dotenv())
+    return dict(os.environ)
 
 # Настройки логирования
-LOG_LEVELS = {
+LOG_LEVELS: Final[Mapping[str, int]] = MappingProxyType({
     "DEBUG": logging.DEBUG,
     "INFO": logging.INFO,
     "WARNING": logging.WARNING,
     "ERROR": logging.ERROR,
     "CRITICAL": logging.CRITICAL
-}
+})
+
+# Доступные модели DuckDuckGo AI
+AVAILABLE_MODELS: Final[Mapping[str, str]] = MappingProxyType({
+    "o3-mini": "o3-mini",
+    "gpt-4o-mini": "gpt-4o-mini",
+    "llama-3.3-70b": "llama-3.3-70b",
+    "claude-3-haiku": "claude-3-haiku",
+    "mixtral-8x7b": "mixtral-8x7b"
+})
 
 class Settings(BaseModel):
     """Настройки приложения"""
 
+    model_config = ConfigDict(frozen=True)
+
     # Базовые настройки приложения
     APP_NAME: str = "duckduckgo-ai-openai-api"
     API_PREFIX: str = ""
-    DEBUG: bool = os.getenv("DEBUG", "False") == "True"
+    DEBUG: bool = _env().get("DEBUG", "False") == "True"
 
     # Настройки безопасности
-    IGNPRE_API_KEYS: bool = os.getenv("IGNPRE_API_KEYS", "False") == "True"
-    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "your-super-secret-admin-token")
+    IGNPRE_API_KEYS: bool = _env().get("IGNPRE_API_KEYS", "False") == "True"
+    ADMIN_TOKEN: str = _env().get("ADMIN_TOKEN", "your-super-secret-admin-token")
+    # Секрет для хеширования API ключей, если не задан - генерируется при запуске каждого процесса
+    PEPPER: str = _env().get("PEPPER", "")
 
     # Настройки базы данных
-    DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
+    DATABASE_URL: Optional[str] = _env().get("DATABASE_URL")
     DB_MODE: str = "PostgreSQL" if DATABASE_URL else "SQLite"
-    SQLITE_DB_PATH: str = os.getenv("SQLITE_DB_PATH", "api_keys.db")
+    SQLITE_DB_PATH: str = _env().get("SQLITE_DB_PATH", "api_keys.db")
+    # Размер пула соединений PostgreSQL (все соединения открываются при запуске каждого процесса)
+    PG_POOL_SIZE: int = int(_env().get("PG_POOL_SIZE", "20"))
+    # Соединения, простаивавшие в пуле дольше этого времени (в секундах), проверяются перед выдачей
+    PG_PRE_PING_IDLE: float = float(_env().get("PG_PRE_PING_IDLE", "30"))
+
+    # Кэш проверенных API ключей (время жизни в секундах, размер) и период записи счетчиков использования
+    API_KEY_CACHE_TTL: float = float(_env().get("API_KEY_CACHE_TTL", "60"))
+    API_KEY_CACHE_SIZE: int = int(_env().get("API_KEY_CACHE_SIZE", "4096"))
+    USAGE_FLUSH_INTERVAL: float = float(_env().get("USAGE_FLUSH_INTERVAL", "2"))
+
+    # Максимальное число потоков для блокирующих операций (БД, DuckDuckGo AI)
+    THREADPOOL_SIZE: int = int(_env().get("THREADPOOL_SIZE", "100"))
+
+    # Количество заранее созданных клиентов DuckDuckGo AI
+    DDGS_POOL_SIZE: int = int(_env().get("DDGS_POOL_SIZE", "4"))
 
     # Настройки моделей
-    DEFAULT_MODEL: str = os.getenv("DEFAULT_MODEL", "llama-3.3-70b")
-    AVAILABLE_MODELS: Dict[str, str] = {
-        "o3-mini": "o3-mini",
-        "gpt-4o-mini": "gpt-4o-mini",
-        "llama-3.3-70b": "llama-3.3-70b",
-        "claude-3-haiku": "claude-3-haiku",
-        "mixtral-8x7b": "mixtral-8x7b"
-    }
+    DEFAULT_MODEL: str = _env().get("DEFAULT_MODEL", "llama-3.3-70b")
+    # Pydantic копирует изменяемые значения по умолчанию через deepcopy, а mappingproxy не копируется,
+    # поэтому полю передается обычный словарь (переприсваивание запрещено frozen-моделью)
+    AVAILABLE_MODELS: Dict[str, str] = dict(AVAILABLE_MODELS)
 
     # Настройки CORS
     CORS_ORIGINS: list = ["*"]
     CORS_HEADERS: list = ["*"]
 
 
-    LOG_LEVEL_STR: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_LEVEL_STR: str = _env().get("LOG_LEVEL", "INFO").upper()
     LOG_LEVEL: int = LOG_LEVELS.get(LOG_LEVEL_STR, logging.INFO)
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Получение единственного экземпляра настроек"""
+    return Settings()
+
+
+settings: Final = get_settings()
\ No newline at end of file
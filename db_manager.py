@@ -1,30 +1,95 @@
 import sqlite3
 import logging
+import threading
+import time
+from collections import Counter, OrderedDict
 from contextlib import contextmanager
-from typing import Dict, List, Any, Generator, Optional, Union, Tuple
-
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import TYPE_CHECKING, Dict, List, Any, Generator, Optional, Union, Tuple
 
 from config import settings
 from logger import setup_logger, log_operation
+from security import hash_key, mask_api_key
+
+if TYPE_CHECKING:
+    from psycopg2.pool import ThreadedConnectionPool
 
 # Настройка логгера
 logger = setup_logger("database")
 
 
+class DatabaseError(Exception):
+    """Ошибка при выполнении операции с базой данных"""
+
+
 class DatabaseManager:
     """Менеджер для работы с базой данных SQLite/PostgreSQL"""
 
     def __init__(self):
         """Инициализация менеджера базы данных"""
-        log_operation(logger, "database_init", f"Режим базы данных: {settings.DB_MODE}")
+        log_operation(logger, "database_init", "Режим базы данных: %s", settings.DB_MODE)
+        self._pg_pool: Optional["ThreadedConnectionPool"] = None
+        # Потоки ждут свободное соединение, а не получают ошибку "connection pool exhausted"
+        self._pg_slots = threading.BoundedSemaphore(settings.PG_POOL_SIZE)
+        # Момент возврата соединения в пул (time.monotonic) по id соединения
+        self._pg_last_used: Dict[int, float] = {}
+        # Соединения SQLite кэшируются отдельно для каждого потока
+        self._sqlite_local = threading.local()
+        # LRU-кэш проверенных API ключей: хеш ключа -> момент истечения (time.monotonic)
+        self._key_cache: "OrderedDict[bytes, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Поколение отзывов: увеличивается при каждом удалении ключей, чтобы проверка,
+        # начатая до удаления, не вернула отозванный ключ в кэш
+        self._cache_generation = 0
+        # Накопленные, но еще не записанные в базу счетчики использования
+        self._usage_deltas: Counter = Counter()
+        self._usage_lock = threading.Lock()
+
+        # Ошибки драйверов, которые get_connection оборачивает в DatabaseError
+        self._driver_errors: Tuple[type, ...] = (sqlite3.Error,)
+
+        if settings.DATABASE_URL and not settings.IGNPRE_API_KEYS:
+            from psycopg2 import Error as PostgresError
+
+            self._pg_pool = self._create_pg_pool()
+            self._driver_errors = (sqlite3.Error, PostgresError)
+
         self.initialize_db()
 
+    @staticmethod
+    def _create_pg_pool() -> "ThreadedConnectionPool":
+        """Создание пула соединений PostgreSQL (psycopg2 импортируется только в этом режиме)"""
+        from psycopg2.extras import RealDictCursor
+        from psycopg2.pool import ThreadedConnectionPool
+
+        # minconn = maxconn: все соединения открываются при запуске и не закрываются при возврате в пул
+        return ThreadedConnectionPool(
+            minconn=settings.PG_POOL_SIZE,
+            maxconn=settings.PG_POOL_SIZE,
+            dsn=settings.DATABASE_URL,
+            sslmode='require',
+            cursor_factory=RealDictCursor
+        )
+
+    def _get_sqlite_connection(self) -> sqlite3.Connection:
+        """Получение соединения SQLite, закрепленного за текущим потоком"""
+        connection = getattr(self._sqlite_local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(settings.SQLITE_DB_PATH)
+            # Настраиваем SQLite для возврата словарей
+            connection.row_factory = sqlite3.Row
+            # WAL позволяет читать базу во время записи, NORMAL достаточно для WAL
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Чтение страниц базы через отображение в память без лишних копирований
+            connection.execute("PRAGMA mmap_size=268435456")
+            self._sqlite_local.connection = connection
+        return connection
+
     @contextmanager
     def get_connection(self) -> Generator:
         """Получение соединения с базой данных"""
         connection = None
+        pg_slot = False
         try:
             if settings.IGNPRE_API_KEYS:
                 # Если активирован режим игнорирования API ключей
@@ -33,30 +98,73 @@ class DatabaseManager:
                 yield None
                 return
 
-            if settings.DATABASE_URL:
-                # PostgreSQL соединение
+            if self._pg_pool:
+                # PostgreSQL соединение из пула
                 log_operation(logger, "database_connect", "PostgreSQL")
-                connection = psycopg2.connect(settings.DATABASE_URL, sslmode='require')
-                connection.cursor_factory = RealDictCursor
+                self._pg_slots.acquire()
+                pg_slot = True
+                connection = self._pg_pool.getconn()
+                if not self._pg_connection_alive(connection):
+                    # Соединение было разорвано (перезапуск сервера, таймаут простоя), заменяем его новым
+                    self._pg_last_used.pop(id(connection), None)
+                    self._pg_pool.putconn(connection, close=True)
+                    # Сбрасываем ссылку, чтобы при ошибке getconn блок finally не вернул соединение повторно
+                    connection = None
+                    connection = self._pg_pool.getconn()
             else:
-                # SQLite соединение
+                # SQLite соединение текущего потока
                 log_operation(logger, "database_connect", "SQLite")
-                connection = sqlite3.connect(settings.SQLITE_DB_PATH)
-                # Настраиваем SQLite для возврата словарей
-                connection.row_factory = sqlite3.Row
+                connection = self._get_sqlite_connection()
 
             yield connection
 
             if connection:
                 connection.commit()
         except Exception as e:
-            if connection:
-                connection.rollback()
-            log_operation(logger, "error", f"Ошибка базы данных: {str(e)}", level=logging.ERROR)
-            raise
+            # У закрытого соединения PostgreSQL rollback сам выбрасывает InterfaceError
+            if connection and not getattr(connection, "closed", False):
+                try:
+                    connection.rollback()
+                except self._driver_errors:
+                    pass
+            if not isinstance(e, self._driver_errors):
+                # Ошибки, не связанные с базой данных, передаются дальше без изменений
+                raise
+            log_operation(logger, "error", "Ошибка базы данных: %s", e, level=logging.ERROR)
+            raise DatabaseError(str(e)) from e
         finally:
-            if connection:
-                connection.close()
+            if connection and self._pg_pool:
+                # Возвращаем соединение в пул, разорванные соединения закрываем
+                if connection.closed:
+                    self._pg_last_used.pop(id(connection), None)
+                else:
+                    self._pg_last_used[id(connection)] = time.monotonic()
+                self._pg_pool.putconn(connection, close=bool(connection.closed))
+            if pg_slot:
+                self._pg_slots.release()
+
+    def _pg_connection_alive(self, connection) -> bool:
+        """Проверка соединения PostgreSQL из пула перед выдачей (запросом - только после простоя)"""
+        if connection.closed:
+            return False
+
+        last_used = self._pg_last_used.get(id(connection))
+        if last_used is not None and time.monotonic() - last_used <= settings.PG_PRE_PING_IDLE:
+            return True
+
+        try:
+            # Транзакция, открытая проверкой, продолжается вызывающим кодом и фиксируется в get_connection
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except self._driver_errors:
+            return False
+
+    def close(self) -> None:
+        """Закрытие всех соединений пула PostgreSQL"""
+        if self._pg_pool:
+            self._pg_pool.closeall()
+            log_operation(logger, "database_connect", "Пул соединений PostgreSQL закрыт")
 
     def initialize_db(self) -> None:
         """Инициализация базы данных при первом запуске"""
@@ -98,7 +206,7 @@ class DatabaseManager:
 
                 log_operation(logger, "database_init", "База данных успешно инициализирована")
             except Exception as e:
-                log_operation(logger, "error", f"Ошибка инициализации базы данных: {str(e)}", level=logging.ERROR)
+                log_operation(logger, "error", "Ошибка инициализации базы данных: %s", e, level=logging.ERROR)
                 raise
 
     def create_api_key(self, key: str, description: Optional[str] = None) -> Dict[str, Any]:
@@ -128,11 +236,11 @@ class DatabaseManager:
                     result = cursor.fetchone()
                     key_data = dict(result)
 
-                log_operation(logger, "api_key_create", f"API ключ создан: {key[:4]}...")
+                log_operation(logger, "api_key_create", "API ключ создан: %s", mask_api_key(key))
                 return key_data
 
             except Exception as e:
-                log_operation(logger, "error", f"Ошибка создания API ключа: {str(e)}", level=logging.ERROR)
+                log_operation(logger, "error", "Ошибка создания API ключа: %s", e, level=logging.ERROR)
                 raise
 
     def delete_api_key(self, key: str) -> bool:
@@ -150,90 +258,204 @@ class DatabaseManager:
                     cursor.execute("DELETE FROM openai_api_keys WHERE key = ?", (key,))
 
                 deleted = cursor.rowcount > 0
-                if deleted:
-                    log_operation(logger, "api_key_delete", f"API ключ удален: {key[:4]}...")
-                else:
-                    log_operation(logger, "api_key_delete", f"API ключ не найден: {key[:4]}...")
 
-                return deleted
+            except Exception as e:
+                log_operation(logger, "error", "Ошибка удаления API ключа: %s", e, level=logging.ERROR)
+                raise
+
+        # Ключ удаляется из кэша только после фиксации транзакции
+        self.invalidate_api_key(key)
+        if deleted:
+            log_operation(logger, "api_key_delete", "API ключ удален: %s", mask_api_key(key))
+        else:
+            log_operation(logger, "api_key_delete", "API ключ не найден: %s", mask_api_key(key))
+
+        return deleted
+
+    def delete_api_keys(self, keys: List[str]) -> int:
+        """Удаление нескольких API ключей одним запросом, возвращает количество удаленных"""
+        if settings.IGNPRE_API_KEYS:
+            return len(keys)
+
+        if not keys:
+            return 0
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                if settings.DATABASE_URL:
+                    cursor.execute("DELETE FROM openai_api_keys WHERE key = ANY(%s)", (list(keys),))
+                    deleted_count = cursor.rowcount
+                else:
+                    # Список разбивается на части, чтобы не превысить лимит параметров SQLite
+                    deleted_count = 0
+                    for start in range(0, len(keys), 500):
+                        batch = keys[start:start + 500]
+                        placeholders = ", ".join("?" * len(batch))
+                        cursor.execute(f"DELETE FROM openai_api_keys WHERE key IN ({placeholders})", batch)
+                        deleted_count += cursor.rowcount
 
             except Exception as e:
-                log_operation(logger, "error", f"Ошибка удаления API ключа: {str(e)}", level=logging.ERROR)
+                log_operation(logger, "error", "Ошибка удаления API ключей: %s", e, level=logging.ERROR)
                 raise
 
+        # Ключи удаляются из кэша только после фиксации транзакции
+        self.invalidate_api_keys(keys)
+        log_operation(logger, "api_key_delete", "Удалено API ключей: %s из %s", deleted_count, len(keys))
+        return deleted_count
+
     def validate_api_key(self, key: str) -> bool:
-        """Проверка валидности API ключа и обновление счетчика использования"""
+        """Проверка валидности API ключа и учет его использования"""
         if settings.IGNPRE_API_KEYS:
             return True
 
+        # Недавно проверенные ключи не требуют обращения к базе данных
+        if self.check_cached_api_key(key):
+            return True
+
+        # Поколение запоминается до запроса: если ключ отзовут во время проверки, он не попадет в кэш
+        generation = self._cache_generation
+
         with self.get_connection() as conn:
             cursor = conn.cursor()
 
             try:
                 if settings.DATABASE_URL:
-                    # Проверяем существование ключа и обновляем счетчик и время последнего использования
-                    cursor.execute("""
-                        UPDATE openai_api_keys 
-                        SET usage_count = usage_count + 1, last_used_at = NOW() 
-                        WHERE key = %s 
-                        RETURNING id
-                    """, (key,))
-                    result = cursor.fetchone()
+                    cursor.execute("SELECT id FROM openai_api_keys WHERE key = %s", (key,))
                 else:
-                    # В SQLite обновляем и получаем значение в два запроса
                     cursor.execute("SELECT id FROM openai_api_keys WHERE key = ?", (key,))
-                    result = cursor.fetchone()
-
-                    if result:
-                        cursor.execute("""
-                            UPDATE openai_api_keys 
-                            SET usage_count = usage_count + 1, last_used_at = CURRENT_TIMESTAMP 
-                            WHERE key = ?
-                        """, (key,))
+                result = cursor.fetchone()
 
                 valid = result is not None
+                if valid:
+                    self._cache_api_key(key, generation)
+                    self._record_usage(key)
+
                 log_status = "успешно" if valid else "неудачно"
-                log_operation(logger, "api_key_validate", f"Проверка API ключа {key[:4]}... - {log_status}")
+                log_operation(logger, "api_key_validate", "Проверка API ключа %s - %s", mask_api_key(key), log_status)
 
                 return valid
 
             except Exception as e:
-                log_operation(logger, "error", f"Ошибка валидации API ключа: {str(e)}", level=logging.ERROR)
+                log_operation(logger, "error", "Ошибка валидации API ключа: %s", e, level=logging.ERROR)
                 raise
 
+    def check_cached_api_key(self, key: str) -> bool:
+        """Проверка API ключа только по кэшу, без обращения к базе данных"""
+        # Ключи в кэше хранятся по хешу, чтобы не держать в памяти открытые значения
+        digest = hash_key(key)
+        with self._cache_lock:
+            expires_at = self._key_cache.get(digest)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._key_cache[digest]
+                return False
+            self._key_cache.move_to_end(digest)
+
+        self._record_usage(key)
+        return True
+
+    def _cache_api_key(self, key: str, generation: int) -> None:
+        """Добавление проверенного API ключа в кэш с вытеснением самых старых записей"""
+        digest = hash_key(key)
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                # После начала проверки ключи отзывались, результат мог устареть
+                return
+            self._key_cache[digest] = time.monotonic() + settings.API_KEY_CACHE_TTL
+            self._key_cache.move_to_end(digest)
+            if len(self._key_cache) > settings.API_KEY_CACHE_SIZE:
+                self._key_cache.popitem(last=False)
+
+    def invalidate_api_key(self, key: str) -> None:
+        """Удаление API ключа из кэша (например, при отзыве ключа)"""
+        self.invalidate_api_keys([key])
+
+    def invalidate_api_keys(self, keys: List[str]) -> None:
+        """Удаление нескольких API ключей из кэша"""
+        digests = [hash_key(key) for key in keys]
+        with self._cache_lock:
+            self._cache_generation += 1
+            for digest in digests:
+                self._key_cache.pop(digest, None)
+
+    def _record_usage(self, key: str) -> None:
+        """Учет использования API ключа (в базу записывается методом flush_usage)"""
+        with self._usage_lock:
+            self._usage_deltas[key] += 1
+
+    def flush_usage(self) -> None:
+        """Запись накопленных счетчиков использования API ключей одной транзакцией"""
+        if settings.IGNPRE_API_KEYS:
+            return
+
+        with self._usage_lock:
+            if not self._usage_deltas:
+                return
+            deltas, self._usage_deltas = self._usage_deltas, Counter()
+
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+
+                if settings.DATABASE_URL:
+                    # Один UPDATE на все ключи: массивы ключей и приращений разворачиваются через UNNEST
+                    cursor.execute("""
+                        UPDATE openai_api_keys AS t
+                        SET usage_count = t.usage_count + d.delta, last_used_at = NOW()
+                        FROM (SELECT UNNEST(%s::text[]) AS key, UNNEST(%s::int[]) AS delta) AS d
+                        WHERE t.key = d.key
+                    """, (list(deltas.keys()), list(deltas.values())))
+                else:
+                    cursor.executemany("""
+                        UPDATE openai_api_keys 
+                        SET usage_count = usage_count + ?, last_used_at = CURRENT_TIMESTAMP 
+                        WHERE key = ?
+                    """, [(delta, key) for key, delta in deltas.items()])
+
+                log_operation(logger, "api_key_validate", "Обновлены счетчики использования %s API ключей", len(deltas))
+        except Exception as e:
+            # Возвращаем несохраненные счетчики, чтобы записать их при следующей попытке
+            with self._usage_lock:
+                self._usage_deltas.update(deltas)
+            log_operation(logger, "error", "Ошибка записи счетчиков использования: %s", e, level=logging.ERROR)
+            raise
+
     def get_all_api_keys(self) -> List[Dict[str, Any]]:
         """Получение всех API ключей"""
         if settings.IGNPRE_API_KEYS:
             return []
 
+        query = """
+            SELECT id, key, description, created_at, last_used_at, usage_count 
+            FROM openai_api_keys
+            ORDER BY created_at DESC
+        """
+
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            if settings.DATABASE_URL:
+                # Серверный курсор: строки передаются порциями, а не одним буфером
+                cursor = conn.cursor(name="api_keys_cursor")
+                cursor.itersize = 1000
+            else:
+                cursor = conn.cursor()
 
             try:
-                if settings.DATABASE_URL:
-                    cursor.execute("""
-                        SELECT id, key, description, created_at, last_used_at, usage_count 
-                        FROM openai_api_keys
-                        ORDER BY created_at DESC
-                    """)
-                else:
-                    cursor.execute("""
-                        SELECT id, key, description, created_at, last_used_at, usage_count 
-                        FROM openai_api_keys
-                        ORDER BY created_at DESC
-                    """)
+                cursor.execute(query)
 
-                # Преобразуем объекты Row в словари
                 if settings.DATABASE_URL:
-                    result = cursor.fetchall()
+                    result = list(cursor)
                 else:
-                    result = [dict(row) for row in cursor.fetchall()]
+                    # Преобразуем объекты Row в словари
+                    result = list(map(dict, cursor.fetchall()))
 
-                log_operation(logger, "database_connect", f"Получено {len(result)} API ключей")
+                log_operation(logger, "database_connect", "Получено %s API ключей", len(result))
                 return result
 
             except Exception as e:
-                log_operation(logger, "error", f"Ошибка получения списка API ключей: {str(e)}", level=logging.ERROR)
+                log_operation(logger, "error", "Ошибка получения списка API ключей: %s", e, level=logging.ERROR)
                 raise
 
 
@@ -1,8 +1,8 @@
 import logging
 import sys
-from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Union
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Union
 
 from config import settings
 
@@ -16,7 +16,7 @@ EMOJI_LEVELS: Dict[int, str] = {
 }
 
 # Словарь с русскими наименованиями операций
-OPERATION_NAMES: Dict[str, str] = {
+OPERATION_NAMES: Mapping[str, str] = MappingProxyType({
     "database_init": "📊 Инициализация базы данных",
     "database_connect": "🔌 Подключение к базе данных",
     "api_key_create": "🔑 Создание API ключа",
@@ -28,20 +28,16 @@ OPERATION_NAMES: Dict[str, str] = {
     "request_received": "📩 Получен запрос",
     "request_processed": "📤 Обработан запрос",
     "error": "❌ Ошибка"
-}
+})
 
 
 class CustomFormatter(logging.Formatter):
     """Форматтер логов с эмодзи и временными метками"""
 
     def format(self, record):
-        emoji = EMOJI_LEVELS.get(record.levelno, "")
-        record.emoji = emoji
-
-        # Добавляем временную метку
-        record.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        record.emoji = EMOJI_LEVELS.get(record.levelno, "")
 
-        # Возвращаем отформатированное сообщение
+        # Временная метка берется из record.created через стандартный asctime
         return super().format(record)
 
 
@@ -65,8 +61,8 @@ def setup_logger(name: str, log_level: Union[str, int] = "INFO") -> logging.Logg
     console_handler.setLevel(level)
 
     # Настраиваем форматирование
-    log_format = "%(emoji)s [%(timestamp)s] %(levelname)s [%(name)s] - %(message)s"
-    formatter = CustomFormatter(log_format)
+    log_format = "%(emoji)s [%(asctime)s] %(levelname)s [%(name)s] - %(message)s"
+    formatter = CustomFormatter(log_format, datefmt="%Y-%m-%d %H:%M:%S")
     console_handler.setFormatter(formatter)
 
     # Добавляем обработчик к логгеру
@@ -88,8 +84,18 @@ def setup_logger(name: str, log_level: Union[str, int] = "INFO") -> logging.Logg
 
     return logger
 
-def log_operation(logger: logging.Logger, operation: str, details: str = "", level: int = logging.INFO) -> None:
-    """Логирование операций с русскими названиями и эмодзи"""
+def log_operation(logger: logging.Logger, operation: str, details: str = "", *args: Any,
+                  level: int = logging.INFO) -> None:
+    """
+    Логирование операций с русскими названиями и эмодзи.
+
+    Аргументы для details в стиле %s подставляются модулем logging только
+    при выводе записи, как в logging.Logger.log
+    """
+    # Не формируем сообщение, если уровень отфильтрован
+    if not logger.isEnabledFor(level):
+        return
+
     operation_name = OPERATION_NAMES.get(operation, operation)
     message = f"{operation_name}: {details}" if details else operation_name
-    logger.log(level, message)
\ No newline at end of file
+    logger.log(level, message, *args)
\ No newline at end of file
@@ -1,15 +1,24 @@
+import asyncio
+import gzip
 import uvicorn
 import logging
-from pathlib import Path
+import os
+from functools import lru_cache
+from typing import Dict, Final, FrozenSet
+
+import anyio.to_thread
+import brotli
+import orjson
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 
 from config import settings
+from db_manager import db_manager
 from logger import setup_logger, log_operation
 from router import router as all_router
+from router.chat import close_ddgs_pool, init_ddgs_pool
 
 # Настройка логгера
 logger = setup_logger("main")
@@ -45,14 +54,50 @@ app.add_middleware(
 # Подключение роутеров
 app.include_router(all_router)
 
-# Настройка статических файлов и шаблонов
-app_directory = Path(__file__).parent
-static_directory = app_directory
+# Путь к веб-интерфейсу
+_HTML_PATH: Final[str] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "website.html")
+
+# Веб-интерфейс загружается в память и сжимается один раз при запуске
+try:
+    with open(_HTML_PATH, "rb") as file:
+        _HTML_BYTES = file.read()
+except OSError as e:
+    log_operation(logger, "error", "Ошибка при загрузке HTML: %s", e, level=logging.ERROR)
+    _HTML_BYTES = "<h1>Ошибка при загрузке веб-интерфейса</h1>".encode("utf-8")
+
+_HTML_BR = brotli.compress(_HTML_BYTES, quality=11)
+_HTML_GZIP = gzip.compress(_HTML_BYTES, compresslevel=9)
+_HTML_HEADERS = {"Cache-Control": "public, max-age=3600", "Vary": "Accept-Encoding"}
+_HTML_BR_HEADERS = {**_HTML_HEADERS, "Content-Encoding": "br"}
+_HTML_GZIP_HEADERS = {**_HTML_HEADERS, "Content-Encoding": "gzip"}
+
+
+@lru_cache(maxsize=256)
+def _accepted_encodings(accept_encoding: str) -> FrozenSet[str]:
+    """Разбор заголовка Accept-Encoding: кодировки, разрешенные клиентом (q > 0)"""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    wildcard = weights.get("*", 0.0)
+    return frozenset(coding for coding in ("br", "gzip") if weights.get(coding, wildcard) > 0)
 
 # Обработчик ошибок
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
-    log_operation(logger, "error", f"Необработанная ошибка: {str(exc)}", level=logging.ERROR)
+    log_operation(logger, "error", "Необработанная ошибка: %s", exc, level=logging.ERROR)
     return JSONResponse(
         status_code=500,
         content={"detail": f"Внутренняя ошибка сервера: {str(exc)}"}
@@ -60,33 +105,65 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 # Главная страница
 @app.get("/", response_class=HTMLResponse)
-async def serve_html():
-    """Отдача HTML страницы"""
-    try:
-        html_path = static_directory / "website.html"
-        with open(html_path, "r", encoding="utf-8") as file:
-            html_content = file.read()
-        return HTMLResponse(content=html_content)
-    except Exception as e:
-        log_operation(logger, "error", f"Ошибка при загрузке HTML: {str(e)}", level=logger.ERROR)
-        return HTMLResponse(content="<h1>Ошибка при загрузке веб-интерфейса</h1>")
+async def serve_html(request: Request):
+    """Отдача HTML страницы (сжатой, если клиент это поддерживает)"""
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    if "br" in accepted:
+        return HTMLResponse(content=_HTML_BR, headers=_HTML_BR_HEADERS)
+    if "gzip" in accepted:
+        return HTMLResponse(content=_HTML_GZIP, headers=_HTML_GZIP_HEADERS)
+    return HTMLResponse(content=_HTML_BYTES, headers=_HTML_HEADERS)
+
+# Ответ проверки состояния не меняется за время работы процесса и кодируется один раз
+_HEALTH_BYTES = orjson.dumps({
+    "status": "ok",
+    "db_mode": settings.DB_MODE,
+    "ignore_api_keys": settings.IGNPRE_API_KEYS
+})
 
 # Маршрут для проверки состояния сервера
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Маршрут для проверки состояния сервера"""
-    return {
-        "status": "ok",
-        "db_mode": settings.DB_MODE,
-        "ignore_api_keys": settings.IGNPRE_API_KEYS
-    }
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
+
+async def flush_usage_periodically():
+    """Периодическая запись счетчиков использования API ключей в базу данных"""
+    while True:
+        await asyncio.sleep(settings.USAGE_FLUSH_INTERVAL)
+        try:
+            await run_in_threadpool(db_manager.flush_usage)
+        except Exception:
+            # Ошибка уже залогирована, счетчики будут записаны при следующей попытке
+            pass
+
+# Запуск фоновых задач при старте сервера
+@app.on_event("startup")
+async def startup_event():
+    """Настройка пула потоков, создание клиентов DuckDuckGo AI и запуск фоновой записи счетчиков"""
+    # По умолчанию AnyIO ограничивает пул 40 потоками, чего мало для долгих запросов к DuckDuckGo AI
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    init_ddgs_pool()
+    app.state.usage_flush_task = asyncio.create_task(flush_usage_periodically())
+
+# Освобождение ресурсов при остановке сервера
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Запись оставшихся счетчиков, закрытие пула соединений и клиентов DuckDuckGo AI"""
+    app.state.usage_flush_task.cancel()
+    try:
+        db_manager.flush_usage()
+    finally:
+        db_manager.close()
+        close_ddgs_pool()
 
 # Запуск приложения
 if __name__ == "__main__":
-    log_operation(logger, "server_start", f"Запуск сервера на порту 8080, режим БД: {settings.DB_MODE}")
+    log_operation(logger, "server_start", "Запуск сервера на порту 8080, режим БД: %s", settings.DB_MODE)
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8080,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        http="httptools"
     )
\ No newline at end of file
@@ -1,17 +1,23 @@
-import json
+import copy
 import logging
+import queue
 import time
-from typing import List, Optional, Dict, Any
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, Literal, Optional, Dict, Any, Iterator
 
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from starlette.responses import StreamingResponse
-from duckduckgo_search import DDGS
 
 from config import settings
 from logger import setup_logger, log_operation
 from .dependencies import validate_api_key
 
+if TYPE_CHECKING:
+    from duckduckgo_search import DDGS
+
 # Настройка логгера
 logger = setup_logger("api.chat")
 
@@ -20,6 +26,80 @@ router = APIRouter(
     tags=["Chat"]
 )
 
+# Список доступных моделей вычисляется один раз при импорте
+_AVAILABLE_MODELS_STR = ', '.join(settings.AVAILABLE_MODELS)
+# Допустимые названия моделей проверяются Pydantic при разборе запроса
+ModelName = Literal[tuple(settings.AVAILABLE_MODELS)]
+
+# Заголовки потокового ответа: запрещают кэширование и буферизацию на прокси (nginx)
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Пул клиентов DuckDuckGo AI: сессия и TLS-соединение создаются один раз и переиспользуются
+_ddgs_pool: "queue.Queue[DDGS]" = queue.Queue(maxsize=settings.DDGS_POOL_SIZE)
+
+# DDGS хранит историю диалога в атрибутах экземпляра, запоминаем их начальные значения
+_CHAT_STATE_DEFAULTS: Dict[str, Any] = {}
+
+
+def _new_ddgs() -> "DDGS":
+    """Создание клиента DuckDuckGo AI (библиотека импортируется при первом использовании)"""
+    from duckduckgo_search import DDGS
+
+    ddgs = DDGS()
+    if not _CHAT_STATE_DEFAULTS:
+        _CHAT_STATE_DEFAULTS.update(
+            (name, copy.copy(value)) for name, value in vars(ddgs).items() if name.startswith("_chat_")
+        )
+    return ddgs
+
+
+def init_ddgs_pool() -> None:
+    """Предварительное создание клиентов DuckDuckGo AI при старте сервера"""
+    for _ in range(settings.DDGS_POOL_SIZE):
+        try:
+            _ddgs_pool.put_nowait(_new_ddgs())
+        except queue.Full:
+            break
+
+
+def _reset_chat_state(ddgs: "DDGS") -> None:
+    """Сброс истории диалога, чтобы запросы разных пользователей не смешивались"""
+    for name, value in _CHAT_STATE_DEFAULTS.items():
+        setattr(ddgs, name, copy.copy(value))
+
+
+@contextmanager
+def _acquire_ddgs() -> Iterator["DDGS"]:
+    """Получение клиента DuckDuckGo AI из пула (при нехватке создается новый)"""
+    try:
+        ddgs = _ddgs_pool.get_nowait()
+    except queue.Empty:
+        ddgs = _new_ddgs()
+
+    try:
+        yield ddgs
+    finally:
+        _reset_chat_state(ddgs)
+        try:
+            _ddgs_pool.put_nowait(ddgs)
+        except queue.Full:
+            pass
+
+
+def _generate(prompt: str, model: str) -> str:
+    """Синхронная генерация полного ответа через клиента из пула"""
+    with _acquire_ddgs() as ddgs:
+        return ddgs.chat(prompt, model=model)
+
+
+def close_ddgs_pool() -> None:
+    """Освобождение клиентов DuckDuckGo AI при остановке сервера"""
+    while True:
+        try:
+            _ddgs_pool.get_nowait()
+        except queue.Empty:
+            break
+
 
 # Модели данных
 class ChatMessage(BaseModel):
@@ -45,10 +125,10 @@ class ChatCompletionRequest(BaseModel):
     Модель запроса на генерацию ответа.
 
     Attributes:
-        model (Optional[str]): Название модели для генерации
+        model (str): Название модели для генерации
                               (по умолчанию из settings.DEFAULT_MODEL)
         messages (List[ChatMessage]): Список сообщений в чате
-        stream (Optional[bool]): Использовать ли потоковый режим генерации (по умолчанию False)
+        stream (bool): Использовать ли потоковый режим генерации (по умолчанию False)
         max_tokens (Optional[int]): Максимальное количество токенов в ответе
         temperature (Optional[float]): Температура генерации (степень рандомизации)
 
@@ -61,12 +141,12 @@ class ChatCompletionRequest(BaseModel):
             "stream": false
         }
     """
-    model: Optional[str] = Field(
+    model: ModelName = Field(
         default=settings.DEFAULT_MODEL,
-        description=f"Модель для генерации. Доступные модели: {', '.join(settings.AVAILABLE_MODELS.keys())}"
+        description=f"Модель для генерации. Доступные модели: {_AVAILABLE_MODELS_STR}"
     )
     messages: List[ChatMessage] = Field(..., description="История сообщений чата")
-    stream: Optional[bool] = Field(False, description="Использовать потоковый режим генерации")
+    stream: bool = Field(False, description="Использовать потоковый режим генерации")
     max_tokens: Optional[int] = Field(None, description="Максимальное количество токенов в ответе")
     temperature: Optional[float] = Field(None, description="Температура генерации (от 0.0 до 1.0)")
 
@@ -168,54 +248,60 @@ async def chat_completions(
 
     # Получаем последнее сообщение пользователя
     prompt = request.messages[-1].content if request.messages else ""
-    # Получаем модель или используем значение по умолчанию
-    model = request.model if request.model and request.model in settings.AVAILABLE_MODELS else settings.DEFAULT_MODEL
+    # Модель уже проверена при разборе запроса
+    model = request.model
 
-    log_operation(logger, "chat_completion", f"Запрос с моделью {model}, stream={request.stream}")
+    log_operation(logger, "chat_completion", "Запрос с моделью %s, stream=%s", model, request.stream)
 
     try:
         # Если запрос на потоковую генерацию
         if request.stream:
             log_operation(logger, "chat_completion", "Использование потоковой генерации")
 
-            # Генератор для потока токенов
+            # Генератор для потока токенов (StreamingResponse выполняет его в пуле потоков)
             def ddgs_streamer():
                 start_time = time.time()
                 token_count = 0
 
+                # Неизменные поля чанка сериализуются один раз, для каждого токена кодируется только его текст
+                chunk_prefix = (
+                    f'data: {{"id":"cmpl-{int(start_time * 1000)}","object":"chat.completion.chunk",'
+                    f'"created":{int(start_time)},"model":{orjson.dumps(model).decode()},'
+                    f'"choices":[{{"delta":{{"content":'
+                ).encode()
+                chunk_suffix = b"}}]}\n\n"
+
                 # Начало SSE формата
-                yield "data: [BEGIN]\n\n"
+                yield b"data: [BEGIN]\n\n"
 
                 try:
-                    for token in DDGS().chat_yield(prompt, model=model):
-                        token_count += 1
-                        chunk = {
-                            "id": f"cmpl-{int(time.time() * 1000)}",
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": model,
-                            "choices": [{"delta": {"content": token}}]
-                        }
-                        yield f"data: {json.dumps(chunk)}\n\n"
+                    with _acquire_ddgs() as ddgs:
+                        for token in ddgs.chat_yield(prompt, model=model):
+                            token_count += 1
+                            yield chunk_prefix + orjson.dumps(token) + chunk_suffix
                 except Exception as e:
                     error_chunk = {
                         "error": True,
                         "message": str(e)
                     }
-                    yield f"data: {json.dumps(error_chunk)}\n\n"
-                    log_operation(logger, "error", f"Ошибка потоковой генерации: {str(e)}", level=logging.ERROR)
+                    yield b"data: " + orjson.dumps(error_chunk) + b"\n\n"
+                    log_operation(logger, "error", "Ошибка потоковой генерации: %s", e, level=logging.ERROR)
 
                 # Завершение SSE
-                yield "data: [DONE]\n\n"
+                yield b"data: [DONE]\n\n"
 
                 duration = time.time() - start_time
                 log_operation(
                     logger,
                     "request_processed",
-                    f"Поток завершен. Токенов: {token_count}, время: {duration:.2f}с"
+                    "Поток завершен. Токенов: %s, время: %.2fс", token_count, duration
                 )
 
-            return StreamingResponse(ddgs_streamer(), media_type="application/x-ndjson")
+            return StreamingResponse(
+                ddgs_streamer(),
+                media_type="text/event-stream",
+                headers=_SSE_HEADERS
+            )
 
         # Для непотоковой генерации
         else:
@@ -223,14 +309,16 @@ async def chat_completions(
             start_time = time.time()
 
             try:
-                # Получаем ответ от DuckDuckGo AI
-                result = DDGS().chat(prompt, model=model)
+                # Получаем ответ от DuckDuckGo AI, не блокируя цикл событий
+                result = await run_in_threadpool(_generate, prompt, model)
+                # Время завершения используется и для полей ответа, и для лога
+                now = time.time()
 
                 # Формируем ответ
                 response = {
-                    "id": f"cmpl-{int(time.time() * 1000)}",
+                    "id": f"cmpl-{int(now * 1000)}",
                     "object": "chat.completion",
-                    "created": int(time.time()),
+                    "created": int(now),
                     "model": model,
                     "choices": [{
                         "message": {"role": "assistant", "content": result},
@@ -239,24 +327,24 @@ async def chat_completions(
                     }]
                 }
 
-                duration = time.time() - start_time
+                duration = now - start_time
                 log_operation(
                     logger,
                     "request_processed",
-                    f"Генерация завершена. Длина ответа: {len(result)}, время: {duration:.2f}с"
+                    "Генерация завершена. Длина ответа: %s, время: %.2fс", len(result), duration
                 )
 
                 return response
 
             except Exception as e:
-                log_operation(logger, "error", f"Ошибка генерации: {str(e)}", level=logging.ERROR)
+                log_operation(logger, "error", "Ошибка генерации: %s", e, level=logging.ERROR)
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Ошибка генерации ответа: {str(e)}"
                 )
 
     except Exception as e:
-        log_operation(logger, "error", f"Необработанная ошибка: {str(e)}", level=logging.ERROR)
+        log_operation(logger, "error", "Необработанная ошибка: %s", e, level=logging.ERROR)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера: {str(e)}"
@@ -1,4 +1,9 @@
-from fastapi import Header, HTTPException, status
+import secrets
+from typing import Final, Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from config import settings
 from logger import setup_logger, log_operation
@@ -7,53 +12,77 @@ import logging
 # Настройка логгера
 logger_dependencies = setup_logger("api.dependencies")
 
+# Неизменяемые настройки проверки, привязанные один раз при импорте
+_IGNORE_KEYS: Final[bool] = settings.IGNPRE_API_KEYS
+# Токен администратора в байтах для сравнения за постоянное время
+_ADMIN_TOKEN_BYTES: Final[bytes] = settings.ADMIN_TOKEN.encode()
 
-async def validate_admin_token(authorization: str = Header(...)):
-    """Зависимость для проверки токена администратора"""
-    if settings.IGNPRE_API_KEYS:
-        log_operation(logger_dependencies, "admin_validate", "Режим без проверки API ключей - пропуск проверки админа")
-        return ""
+# Разбор заголовка Authorization: Bearer <токен>, ошибки формируются в _extract_token
+_bearer = HTTPBearer(
+    auto_error=False,
+    description="Введите токен администратора или API ключ"
+)
 
-    if not authorization or not authorization.startswith("Bearer "):
+# Ошибки со статическим текстом создаются один раз и переиспользуются.
+# Перед выбросом traceback сбрасывается, чтобы он не накапливался между запросами
+_EXC_BAD_HEADER = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Некорректный или отсутствующий заголовок Authorization"
+)
+_EXC_BAD_ADMIN_TOKEN = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN,
+    detail="Недействительный токен администратора"
+)
+_EXC_BAD_API_KEY = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Недействительный API ключ"
+)
+
+def _extract_token(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
+    """Получение токена из разобранного заголовка Authorization"""
+    if credentials is None:
         log_operation(logger_dependencies, "error", "Некорректный заголовок Authorization", level=logging.WARNING)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Некорректный или отсутствующий заголовок Authorization"
-        )
-
-    token = authorization.split(" ")[1]
-    if token != settings.ADMIN_TOKEN:
-        log_operation(logger_dependencies, "error", "Недействительный токен администратора", level=logging.WARNING)
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Недействительный токен администратора"
-        )
-
-    log_operation(logger_dependencies, "admin_validate", "Токен администратора успешно проверен")
-    return token
-
-
-async def validate_api_key(authorization: str = Header(...)):
-    """Зависимость для проверки API ключа"""
-    if settings.IGNPRE_API_KEYS:
-        log_operation(logger_dependencies, "api_key_validate", "Режим без проверки API ключей")
+        raise _EXC_BAD_HEADER.with_traceback(None)
+
+    return credentials.credentials
+
+
+# Реализация зависимостей выбирается один раз при импорте: режим не меняется во время работы процесса
+if _IGNORE_KEYS:
+    log_operation(logger_dependencies, "api_key_validate", "Режим без проверки API ключей и токена администратора")
+
+    async def validate_admin_token():
+        """Зависимость для проверки токена администратора (проверка отключена, заголовок не разбирается)"""
         return ""
 
-    if not authorization or not authorization.startswith("Bearer "):
-        log_operation(logger_dependencies, "error", "Некорректный заголовок Authorization", level=logging.WARNING)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Некорректный или отсутствующий заголовок Authorization"
-        )
-
-    token = authorization.split(" ")[1]
-    valid = db_manager.validate_api_key(token)
-
-    if not valid:
-        log_operation(logger_dependencies, "error", "Недействительный API ключ", level=logging.WARNING)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Недействительный API ключ"
-        )
-
-    return token
\ No newline at end of file
+    async def validate_api_key():
+        """Зависимость для проверки API ключа (проверка отключена, заголовок не разбирается)"""
+        return ""
+
+else:
+    async def validate_admin_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)):
+        """Зависимость для проверки токена администратора"""
+        token = _extract_token(credentials)
+        if not secrets.compare_digest(token.encode(), _ADMIN_TOKEN_BYTES):
+            log_operation(logger_dependencies, "error", "Недействительный токен администратора", level=logging.WARNING)
+            raise _EXC_BAD_ADMIN_TOKEN.with_traceback(None)
+
+        # Успешная проверка происходит на каждый запрос администратора, поэтому пишется только в DEBUG
+        log_operation(logger_dependencies, "admin_validate", "Токен администратора успешно проверен", level=logging.DEBUG)
+        return token
+
+    async def validate_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)):
+        """Зависимость для проверки API ключа"""
+        token = _extract_token(credentials)
+
+        # Ключи из кэша проверяются без перехода в пул потоков
+        if db_manager.check_cached_api_key(token):
+            return token
+
+        valid = await run_in_threadpool(db_manager.validate_api_key, token)
+
+        if not valid:
+            log_operation(logger_dependencies, "error", "Недействительный API ключ", level=logging.WARNING)
+            raise _EXC_BAD_API_KEY.with_traceback(None)
+
+        return token
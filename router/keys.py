@@ -1,17 +1,33 @@
-import secrets
-from typing import List, Dict, Any, Optional
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Final, Optional
 
 from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 from config import settings
 from logger import setup_logger, log_operation
-from db_manager import db_manager
+from db_manager import DatabaseError, db_manager
+from security import generate_api_key, mask_api_key
 from .dependencies import validate_admin_token
 
 # Настройка логгера
 logger = setup_logger("api.keys")
 
+# Режим без проверки API ключей задается при запуске
+_IGNORE_KEYS: Final[bool] = settings.IGNPRE_API_KEYS
+
+# Максимальное количество ключей в одном запросе массового удаления
+_MAX_BULK_DELETE_KEYS: Final[int] = 1000
+
+# Ошибка со статическим текстом создается один раз (traceback сбрасывается перед выбросом)
+_EXC_KEY_NOT_FOUND = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND,
+    detail="API ключ не найден"
+)
+
 router = APIRouter(
     prefix="/api-keys",
     tags=["API Keys"],
@@ -96,6 +112,43 @@ class ApiKeysListResponse(BaseModel):
     api_keys: List[ApiKeyResponse] = Field(..., description="Список API ключей")
 
 
+class ApiKeysBulkDelete(BaseModel):
+    """
+    Модель для массового удаления API ключей.
+
+    Attributes:
+        keys (List[str]): Список API ключей для удаления (не более 1000)
+
+    Example:
+        {
+            "keys": ["abcdef1234567890", "0987654321fedcba"]
+        }
+    """
+    keys: List[str] = Field(
+        ...,
+        max_length=_MAX_BULK_DELETE_KEYS,
+        description=f"Список API ключей для удаления (не более {_MAX_BULK_DELETE_KEYS})"
+    )
+
+
+class ApiKeysBulkDeleteResponse(BaseModel):
+    """
+    Модель ответа на массовое удаление API ключей.
+
+    Attributes:
+        detail (str): Детальное описание результата операции
+        deleted_count (int): Количество удаленных ключей
+
+    Example:
+        {
+            "detail": "API ключи удалены",
+            "deleted_count": 2
+        }
+    """
+    detail: str = Field(..., description="Детальное описание результата операции")
+    deleted_count: int = Field(..., description="Количество удаленных ключей")
+
+
 class MessageResponse(BaseModel):
     """
     Модель для сообщений об успешных операциях.
@@ -114,11 +167,13 @@ class MessageResponse(BaseModel):
 # Маршруты
 @router.get(
     "/",
-    response_model=ApiKeysListResponse,
+    response_model=None,
+    response_class=ORJSONResponse,
+    responses={200: {"model": ApiKeysListResponse}},
     summary="Получение списка всех API ключей",
     description="Возвращает список всех API ключей, зарегистрированных в системе."
 )
-async def list_api_keys() -> ApiKeysListResponse:
+async def list_api_keys() -> ORJSONResponse:
     """
     Получение списка всех API ключей.
 
@@ -127,7 +182,7 @@ async def list_api_keys() -> ApiKeysListResponse:
     а также счетчики использования.
 
     Returns:
-        ApiKeysListResponse: Объект, содержащий список API ключей
+        ORJSONResponse: Ответ со списком API ключей в формате ApiKeysListResponse
 
     Raises:
         HTTPException: В случае ошибок при получении данных из базы
@@ -143,20 +198,22 @@ async def list_api_keys() -> ApiKeysListResponse:
     """
     log_operation(logger, "request_received", "Запрос на получение списка API ключей")
 
+    if _IGNORE_KEYS:
+        return ORJSONResponse(content={"api_keys": []})
+
     try:
-        if settings.IGNPRE_API_KEYS:
-            return ApiKeysListResponse(api_keys=[])
-
-        api_keys = db_manager.get_all_api_keys()
-        log_operation(logger, "request_processed", f"Возвращено {len(api_keys)} API ключей")
-        return ApiKeysListResponse(api_keys=api_keys)
-    except Exception as e:
-        log_operation(logger, "error", f"Ошибка при получении списка API ключей: {str(e)}", level=logger.ERROR)
+        api_keys = await run_in_threadpool(db_manager.get_all_api_keys)
+    except DatabaseError as e:
+        log_operation(logger, "error", "Ошибка при получении списка API ключей: %s", e, level=logging.ERROR)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера: {str(e)}"
         )
 
+    log_operation(logger, "request_processed", "Возвращено %s API ключей", len(api_keys))
+    # Строки из базы сериализуются напрямую, без создания модели Pydantic на каждую запись
+    return ORJSONResponse(content={"api_keys": api_keys})
+
 
 @router.post(
     "/",
@@ -196,25 +253,29 @@ async def create_api_key(api_key_create: ApiKeyCreate) -> ApiKeyResponse:
     """
     log_operation(logger, "request_received", "Запрос на создание API ключа")
 
-    try:
-        # Генерация нового API ключа
-        new_key = secrets.token_hex(16)
-
-        if settings.IGNPRE_API_KEYS:
-            return ApiKeyResponse(key=new_key, description=api_key_create.description)
+    # Генерация нового API ключа
+    new_key = generate_api_key()
 
-        # Создание API ключа в базе данных
-        key_data = db_manager.create_api_key(new_key, api_key_create.description)
-        log_operation(logger, "request_processed", f"API ключ создан: {new_key[:4]}...")
+    if _IGNORE_KEYS:
+        return ApiKeyResponse(key=new_key, description=api_key_create.description)
 
-        return ApiKeyResponse(**key_data)
-    except Exception as e:
-        log_operation(logger, "error", f"Ошибка при создании API ключа: {str(e)}", level=logger.ERROR)
+    # Создание API ключа в базе данных
+    try:
+        key_data = await run_in_threadpool(db_manager.create_api_key, new_key, api_key_create.description)
+    except DatabaseError as e:
+        log_operation(logger, "error", "Ошибка при создании API ключа: %s", e, level=logging.ERROR)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера: {str(e)}"
         )
 
+    log_operation(logger, "request_processed", "API ключ создан: %s", mask_api_key(new_key))
+    # PostgreSQL возвращает created_at как datetime, модель ответа ожидает строку
+    created_at = key_data.get("created_at")
+    if isinstance(created_at, datetime):
+        key_data["created_at"] = created_at.isoformat()
+    return ApiKeyResponse(**key_data)
+
 
 @router.delete(
     "/{key}",
@@ -246,28 +307,76 @@ async def delete_api_key(key: str) -> MessageResponse:
             -H "Authorization: Bearer ваш_админ_токен"
         ```
     """
-    log_operation(logger, "request_received", f"Запрос на удаление API ключа {key[:4]}...")
+    log_operation(logger, "request_received", "Запрос на удаление API ключа %s", mask_api_key(key))
+
+    if _IGNORE_KEYS:
+        return MessageResponse(detail="API ключ удален")
 
     try:
-        if settings.IGNPRE_API_KEYS:
-            return MessageResponse(detail="API ключ удален")
+        deleted = await run_in_threadpool(db_manager.delete_api_key, key)
+    except DatabaseError as e:
+        log_operation(logger, "error", "Ошибка при удалении API ключа: %s", e, level=logging.ERROR)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Внутренняя ошибка сервера: {str(e)}"
+        )
 
-        deleted = db_manager.delete_api_key(key)
+    if not deleted:
+        log_operation(logger, "error", "API ключ не найден: %s", mask_api_key(key), level=logging.WARNING)
+        raise _EXC_KEY_NOT_FOUND.with_traceback(None)
 
-        if not deleted:
-            log_operation(logger, "error", f"API ключ не найден: {key[:4]}...", level=logger.WARNING)
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="API ключ не найден"
-            )
+    log_operation(logger, "request_processed", "API ключ удален: %s", mask_api_key(key))
+    return MessageResponse(detail="API ключ удален")
 
-        log_operation(logger, "request_processed", f"API ключ удален: {key[:4]}...")
-        return MessageResponse(detail="API ключ удален")
-    except HTTPException:
-        raise
-    except Exception as e:
-        log_operation(logger, "error", f"Ошибка при удалении API ключа: {str(e)}", level=logger.ERROR)
+
+@router.delete(
+    "/",
+    response_model=ApiKeysBulkDeleteResponse,
+    summary="Массовое удаление API ключей",
+    description="Удаляет несколько API ключей одним запросом."
+)
+async def delete_api_keys(payload: ApiKeysBulkDelete) -> ApiKeysBulkDeleteResponse:
+    """
+    Массовое удаление API ключей.
+
+    Удаляет все переданные API ключи одним запросом к базе данных.
+    Ключи, которых нет в базе, пропускаются.
+
+    Args:
+        payload (ApiKeysBulkDelete): Список API ключей для удаления
+
+    Returns:
+        ApiKeysBulkDeleteResponse: Сообщение и количество удаленных ключей
+
+    Raises:
+        HTTPException: При ошибках в базе данных
+
+    Note:
+        Требуется токен администратора для доступа к этому эндпоинту.
+
+    Example:
+        ```
+        curl -X DELETE "http://localhost:8080/api-keys/" \
+            -H "Content-Type: application/json" \
+            -H "Authorization: Bearer ваш_админ_токен" \
+            -d '{
+                "keys": ["abcdef1234567890", "0987654321fedcba"]
+            }'
+        ```
+    """
+    log_operation(logger, "request_received", "Запрос на удаление %s API ключей", len(payload.keys))
+
+    if _IGNORE_KEYS:
+        return ApiKeysBulkDeleteResponse(detail="API ключи удалены", deleted_count=len(payload.keys))
+
+    try:
+        deleted_count = await run_in_threadpool(db_manager.delete_api_keys, payload.keys)
+    except DatabaseError as e:
+        log_operation(logger, "error", "Ошибка при удалении API ключей: %s", e, level=logging.ERROR)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    log_operation(logger, "request_processed", "Удалено API ключей: %s", deleted_count)
+    return ApiKeysBulkDeleteResponse(detail="API ключи удалены", deleted_count=deleted_count)
\ No newline at end of file
@@ -2,29 +2,41 @@ import secrets
 import hashlib
 from typing import Optional
 
-from .logger import setup_logger, log_operation
+from config import settings
+from logger import setup_logger, log_operation
 
 # Настройка логгера
 logger = setup_logger("core.security")
 
-def generate_api_key(length: int = 32) -> str:
-    """Генерация API ключа указанной длины"""
-    return secrets.token_hex(length // 2)
+# Ключ BLAKE2b (32 байта) для хеширования API ключей. Из PEPPER любой длины ключ выводится хешированием,
+# без PEPPER генерируется случайный ключ и хеши действительны только в пределах процесса
+_PEPPER = (
+    hashlib.blake2b(settings.PEPPER.encode(), digest_size=32).digest()
+    if settings.PEPPER
+    else secrets.token_bytes(32)
+)
 
-def hash_key(api_key: str) -> str:
-    """Хеширование API ключа для безопасного хранения"""
-    return hashlib.sha256(api_key.encode()).hexdigest()
+def generate_api_key(nbytes: int = 16) -> str:
+    """Генерация URL-безопасного API ключа из nbytes случайных байт (16 байт - 22 символа)"""
+    return secrets.token_urlsafe(nbytes)
+
+def hash_key(api_key: str) -> bytes:
+    """Хеширование API ключа ключевым BLAKE2b (используется как ключ кэша проверенных API ключей)"""
+    return hashlib.blake2b(api_key.encode(), digest_size=32, key=_PEPPER).digest()
 
 def verify_key_hash(api_key: str, hashed_key: str) -> bool:
-    """Проверка API ключа по его хешу"""
-    return hash_key(api_key) == hashed_key
+    """
+    Проверка API ключа по его hex-хешу за постоянное время.
+
+    Хеши, полученные в другом процессе, совпадают только при заданном PEPPER
+    """
+    return secrets.compare_digest(hash_key(api_key), bytes.fromhex(hashed_key))
 
 def generate_rate_limit_key(api_key: str, endpoint: str) -> str:
     """Создание ключа для ограничения частоты запросов"""
-    return f"{api_key}:{endpoint}"
+    # Результат не кэшируется: кэш хранил бы открытые значения API ключей
+    return api_key + ":" + endpoint
 
 def mask_api_key(api_key: str) -> str:
     """Маскирование API ключа для логов и вывода (показывает только первые 4 и последние 4 символа)"""
-    if len(api_key) <= 8:
-        return "****"
-    return f"{api_key[:4]}...{api_key[-4:]}"
\ No newline at end of file
+    return "****" if len(api_key) <= 8 else api_key[:4] + "..." + api_key[-4:]
\ No newline at end of file